@@ -1,13 +1,33 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
+import base64
+import contextlib
+import hashlib
+import heapq
+import html as htmllib
+import http.client
+import io
 import json
 import os
+import queue
 import re
+import sqlite3
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+import urllib.error
 import urllib.parse
 import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError:  # optional: without Pillow transparency is checked with ImageMagick's identify
+    Image = None
 
 
 STORES = [
@@ -33,134 +53,436 @@ STORES = [
 
 
 USER_AGENT = "Mozilla/5.0 (compatible; TorqueIndexLogoHunter/0.1; +https://localhost)"
+HTTP_TIMEOUT = 25
+MAX_REDIRECTS = 5
+# redirect bodies larger than this (or unsized) are not drained; the connection is dropped
+MAX_REDIRECT_BODY = 64 * 1024
+
+# stores are crawled concurrently; the work is almost entirely network-bound
+STORE_WORKERS = 6
+# candidate trials (HEAD, GET, transparency check) run concurrently within a store
+CANDIDATE_WORKERS = 8
+
+# candidate assets larger than this are never logos worth keeping
+MAX_ASSET_BYTES = 2_000_000
+# store pages are streamed and abandoned past this size
+MAX_HTML_BYTES = 4_000_000
+RASTER_TYPES = ("image/png", "image/webp", "image/gif", "image/x-icon")
+RASTER_EXTS = (".png", ".webp", ".gif", ".ico")
+
+# candidates are tried in score tiers (>= 8, >= 4, >= 0, rest); a tier is only
+# reached once every candidate in the tiers above it has failed
+SCORE_TIERS = (8, 4, 0)
+# urls of content images; score_candidate pushes these down
+_CONTENT_IMAGE_RE = re.compile(r"banner|slideshow|hero|collection|product")
+# negative-scoring urls matching these are content images, not logos; never fetched
+_REJECT_RE = re.compile(r"banner|slideshow|hero|collection|product|cart|sprite")
+
+# compiled once at import; parse_candidates runs these over every store page
+_TAG_RE = re.compile(r"<(img|link|meta)\b([^>]*)>", re.IGNORECASE)
+_ATTR_RE = re.compile(r"""([^\s"'<>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+
+# on-disk response cache so reruns don't hit the network; set LOGO_HUNTER_NO_CACHE=1 to
+# bypass it, or delete the file to clear it
+CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "torqueindex", "http.db"
+)
+CACHE_TTL = 24 * 60 * 60
+# stale responses are kept for revalidation, but dropped once unrefreshed this long
+CACHE_MAX_AGE = 7 * CACHE_TTL
+# bump when the meaning of cached transparency verdicts changes; older verdicts are dropped
+CACHE_VERSION = 3
+
+_cache_lock = threading.Lock()
+_cache_conn: sqlite3.Connection | None = None
+_cache_opened = False
+
+
+def _cache() -> sqlite3.Connection | None:
+    # lazily opened and shared by all worker threads; callers must hold _cache_lock
+    global _cache_conn, _cache_opened
+    if _cache_opened:
+        return _cache_conn
+
+    _cache_opened = True
+    if os.environ.get("LOGO_HUNTER_NO_CACHE"):
+        return None
+
+    conn = None
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        # short lock timeout: another run holding the db should cost a miss, not a stall
+        conn = sqlite3.connect(CACHE_PATH, timeout=1, check_same_thread=False)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+            conn.execute("DROP TABLE IF EXISTS transparency")
+            conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, content_type TEXT, etag TEXT, last_modified TEXT, "
+            "body BLOB, fetched_at REAL)"
+        )
+        # verdicts are keyed by checker too, Pillow and identify can disagree on edge cases
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS transparency ("
+            "sha256 TEXT, checker TEXT, transparent INTEGER, checked_at REAL, PRIMARY KEY (sha256, checker))"
+        )
+        conn.execute("DELETE FROM responses WHERE fetched_at < ?", (time.time() - CACHE_MAX_AGE,))
+        conn.execute("DELETE FROM transparency WHERE checked_at < ?", (time.time() - CACHE_MAX_AGE,))
+        conn.commit()
+    except (sqlite3.Error, OSError):
+        # caching is best effort; run uncached rather than fail
+        if conn is not None:
+            conn.close()
+        return None
+
+    _cache_conn = conn
+    return conn
+
+
+def _cache_exec(sql: str, params: tuple) -> tuple | None:
+    # first row of the statement, or None; any sqlite error (locked, disk full, corrupt)
+    # counts as a miss for reads and a no-op for writes
+    with _cache_lock:
+        conn = _cache()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(sql, params).fetchone()
+            conn.commit()
+        except sqlite3.Error:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            return None
+        return row
 
 
-def fetch_html(url: str) -> str:
-    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-    with urllib.request.urlopen(req, timeout=25) as resp:
-        data = resp.read()
-        # best-effort decoding
+def _cache_get(url: str) -> tuple | None:
+    return _cache_exec(
+        "SELECT content_type, etag, last_modified, body, fetched_at FROM responses WHERE url = ?", (url,)
+    )
+
+
+def _cache_put(url: str, content_type: str, etag: str, last_modified: str, body: bytes) -> None:
+    _cache_exec(
+        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+        (url, content_type, etag, last_modified, body, time.time()),
+    )
+
+
+def _cache_touch(url: str) -> None:
+    _cache_exec("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+
+# idle keep-alive connections per (scheme, host), shared by all worker threads
+_pool_lock = threading.Lock()
+_pool: dict[tuple[str, str], list[http.client.HTTPConnection]] = {}
+
+
+def _checkout(scheme: str, netloc: str) -> tuple[http.client.HTTPConnection, bool]:
+    # (connection, reused)
+    with _pool_lock:
+        idle = _pool.get((scheme, netloc))
+        if idle:
+            return idle.pop(), True
+    return _connect(scheme, netloc), False
+
+
+def _connect(scheme: str, netloc: str) -> http.client.HTTPConnection:
+    cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    proxy = _proxy(scheme, netloc)
+    if proxy is None:
+        return cls(netloc, timeout=HTTP_TIMEOUT)
+
+    conn = cls(proxy.hostname, proxy.port or 80, timeout=HTTP_TIMEOUT)
+    if scheme == "https":
+        # CONNECT through the proxy, then TLS to the real host
+        conn.set_tunnel(netloc, headers=_proxy_headers(proxy))
+    return conn
+
+
+# the *_proxy / no_proxy environment settings urlopen used to honour
+_PROXIES = urllib.request.getproxies()
+
+
+def _proxy(scheme: str, netloc: str) -> urllib.parse.SplitResult | None:
+    proxy = _PROXIES.get(scheme)
+    if not proxy or urllib.request.proxy_bypass(netloc):
+        return None
+    if "://" not in proxy:
+        proxy = "http://" + proxy
+    return urllib.parse.urlsplit(proxy)
+
+
+def _proxy_headers(proxy: urllib.parse.SplitResult) -> dict:
+    if proxy.username is None:
+        return {}
+    creds = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(creds.encode()).decode("ascii")}
+
+
+def _checkin(scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+    with _pool_lock:
+        idle = _pool.setdefault((scheme, netloc), [])
+        if len(idle) < CANDIDATE_WORKERS:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+@contextlib.contextmanager
+def _open(url: str, method: str, headers: dict | None = None):
+    # pooled keep-alive request that follows redirects; raises HTTPError for 4xx/5xx
+    headers = {"User-Agent": USER_AGENT, **(headers or {})}
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported url: {url}")
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+        request_headers = headers
+        proxy = _proxy(parts.scheme, parts.netloc) if parts.scheme == "http" else None
+        if proxy is not None:
+            # plain http goes to the proxy with an absolute-URI request line
+            path = urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path or "/", parts.query, ""))
+            request_headers = {**headers, **_proxy_headers(proxy)}
+
+        conn, reused = _checkout(parts.scheme, parts.netloc)
         try:
-            return data.decode("utf-8", errors="replace")
-        except Exception:
-            return data.decode("latin-1", errors="replace")
+            conn.request(method, path, headers=request_headers)
+            resp = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            if not reused:
+                raise
+            # the server dropped an idle connection; retry once on a fresh one
+            conn = _connect(parts.scheme, parts.netloc)
+            try:
+                conn.request(method, path, headers=request_headers)
+                resp = conn.getresponse()
+            except BaseException:
+                conn.close()
+                raise
+
+        location = resp.getheader("Location")
+        if resp.status in (301, 302, 303, 307, 308) and location:
+            # only small, sized redirect bodies are worth draining to keep the connection
+            length = resp.headers.get("Content-Length") or ""
+            if resp.length == 0 or (length.isdigit() and int(length) <= MAX_REDIRECT_BODY):
+                try:
+                    _read_capped(resp, MAX_REDIRECT_BODY)
+                except (SizeLimitExceeded, http.client.HTTPException, OSError):
+                    conn.close()
+                else:
+                    _checkin(parts.scheme, parts.netloc, conn)
+            else:
+                conn.close()
+            url = urllib.parse.urljoin(url, location)
+            continue
+
+        try:
+            if resp.status >= 400:
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+            yield resp
+        finally:
+            # only a fully read response leaves the connection reusable
+            if not resp.isclosed() and resp.length == 0:
+                resp.read()  # HEAD/304: nothing to read, but marks the response done
+            if resp.isclosed():
+                _checkin(parts.scheme, parts.netloc, conn)
+            else:
+                conn.close()
+        return
+
+    raise http.client.HTTPException(f"too many redirects: {url}")
+
+
+class SizeLimitExceeded(Exception):
+    pass
+
+
+def _read_capped(resp, limit: int) -> bytes:
+    # stream the body and give up as soon as it is over the limit
+    length = resp.headers.get("Content-Length") or ""
+    if length.isdigit() and int(length) > limit:
+        raise SizeLimitExceeded(f"response is {length} bytes, limit is {limit}")
+
+    buf = bytearray()
+    while True:
+        chunk = resp.read(65536)
+        if not chunk:
+            break
+        buf.extend(chunk)
+        if len(buf) > limit:
+            raise SizeLimitExceeded(f"response exceeds {limit} bytes")
+    return bytes(buf)
+
+
+def _http_get(url: str, limit: int) -> tuple[str, bytes]:
+    cached = _cache_get(url)
+    headers = {}
+    if cached:
+        content_type, etag, last_modified, body, fetched_at = cached
+        if time.time() - fetched_at < CACHE_TTL:
+            return content_type, body
+        # stale: revalidate, a 304 keeps the cached body
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    with _open(url, "GET", headers) as resp:
+        if resp.status == 304 and cached:
+            _cache_touch(url)
+            return cached[0], cached[3]
+        content_type = _content_type(resp)
+        etag = resp.headers.get("ETag") or ""
+        last_modified = resp.headers.get("Last-Modified") or ""
+        data = _read_capped(resp, limit)
+
+    _cache_put(url, content_type, etag, last_modified, data)
+    return content_type, data
+
+
+def _content_type(resp) -> str:
+    return (resp.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+
+
+def head(url: str) -> tuple[str, int | None]:
+    # (content_type, content_length) from headers alone; length is None when unknown
+    cached = _cache_get(url)
+    if cached and time.time() - cached[4] < CACHE_TTL:
+        return cached[0], len(cached[3])
+
+    with _open(url, "HEAD") as resp:
+        length = resp.headers.get("Content-Length") or ""
+        return _content_type(resp), int(length) if length.isdigit() else None
 
 
-def abs_url(base_url: str, maybe_url: str) -> str:
+def fetch_html(url: str) -> str:
+    _, data = _http_get(url, MAX_HTML_BYTES)
+    # best-effort decoding
+    try:
+        return data.decode("utf-8", errors="replace")
+    except Exception:
+        return data.decode("latin-1", errors="replace")
+
+
+def abs_url(base_url: str, maybe_url: str, scheme_host: str = "") -> str:
     if not maybe_url:
         return ""
 
     maybe_url = maybe_url.strip()
     if maybe_url.startswith("//"):
         return "https:" + maybe_url
-    if maybe_url.startswith("http://") or maybe_url.startswith("https://"):
+    if maybe_url.startswith(("http://", "https://")):
         return maybe_url
+    # root-relative paths just need the origin; scheme_host is passed in by callers
+    # resolving many urls against the same base
+    if scheme_host and maybe_url.startswith("/"):
+        return scheme_host + maybe_url
     return urllib.parse.urljoin(base_url + "/", maybe_url)
 
 
 def parse_candidates(html: str, base_url: str) -> list[dict]:
-    candidates: list[dict] = []
-
-    # img tags
-    for m in re.finditer(r"<img\b[^>]*>", html, flags=re.IGNORECASE):
-        tag = m.group(0)
-        src = _attr(tag, "src") or _attr(tag, "data-src") or ""
-        srcset = _attr(tag, "srcset") or ""
-        alt = _attr(tag, "alt") or ""
-        cls = _attr(tag, "class") or ""
-        _id = _attr(tag, "id") or ""
-
-        urls = []
-        if src:
-            urls.append(src)
-        if srcset:
-            # take first url in srcset
-            first = srcset.split(",")[0].strip().split(" ")[0]
-            if first:
-                urls.append(first)
-
-        for u in urls:
-            u_abs = abs_url(base_url, u)
-            if u_abs:
-                candidates.append(
-                    {
-                        "url": u_abs,
-                        "alt": alt,
-                        "class": cls,
-                        "id": _id,
-                        "source": "img",
-                    }
-                )
-
-    # link rel icons / preload
-    for m in re.finditer(r"<link\b[^>]*>", html, flags=re.IGNORECASE):
-        tag = m.group(0)
-        rel = (_attr(tag, "rel") or "").lower()
-        href = _attr(tag, "href") or ""
-        as_attr = (_attr(tag, "as") or "").lower()
-        if not href:
-            continue
-        if "icon" in rel or ("preload" in rel and as_attr == "image"):
-            candidates.append(
-                {
-                    "url": abs_url(base_url, href),
-                    "alt": rel,
-                    "class": "",
-                    "id": "",
-                    "source": "link",
-                }
-            )
-
-    # meta items that could point to logo-ish images
-    for m in re.finditer(r"<meta\b[^>]*>", html, flags=re.IGNORECASE):
-        tag = m.group(0)
-        prop = (_attr(tag, "property") or "").lower()
-        name = (_attr(tag, "name") or "").lower()
-        content = _attr(tag, "content") or ""
-        key = prop or name
-        if not content:
-            continue
-        if key in ("og:image", "twitter:image"):
-            candidates.append(
-                {
-                    "url": abs_url(base_url, content),
-                    "alt": key,
-                    "class": "",
-                    "id": "",
-                    "source": "meta",
-                }
-            )
-
-    # de-dupe by url
-    seen = set()
-    uniq = []
-    for c in candidates:
-        u = c.get("url", "")
-        if not u or u in seen:
-            continue
-        seen.add(u)
-        uniq.append(c)
-
-    return uniq
-
-
-def _attr(tag: str, name: str) -> str:
-    # naive attribute extraction
-    m = re.search(r"\b" + re.escape(name) + r"\s*=\s*(['\"])(.*?)\1", tag, flags=re.IGNORECASE)
-    if m:
-        return m.group(2)
-    # unquoted
-    m = re.search(r"\b" + re.escape(name) + r"\s*=\s*([^\s>]+)", tag, flags=re.IGNORECASE)
-    if m:
-        return m.group(1)
-    return ""
+    # de-duped by url as we go (first occurrence wins); bucketed per tag so img
+    # candidates still precede link/meta ones on score ties
+    found: dict[str, dict[str, dict]] = {"img": {}, "link": {}, "meta": {}}
+
+    base = urllib.parse.urlsplit(base_url)
+    scheme_host = f"{base.scheme}://{base.netloc}"
+
+    # single pass over img/link/meta tags; attributes are tokenized once per tag
+    for m in _TAG_RE.finditer(html):
+        tag = m.group(1).lower()
+        attrs = _attrs(m.group(2))
+        candidates = found[tag]
+
+        if tag == "img":
+            src = attrs.get("src") or attrs.get("data-src") or ""
+            srcset = attrs.get("srcset", "")
+            alt = attrs.get("alt", "")
+            cls = attrs.get("class", "")
+            _id = attrs.get("id", "")
+
+            urls = []
+            if src:
+                urls.append(src)
+            if srcset:
+                # take first url in srcset
+                first = srcset.split(",", 1)[0].strip().split(" ", 1)[0]
+                if first:
+                    urls.append(first)
+
+            for u in urls:
+                u_abs = abs_url(base_url, u, scheme_host)
+                if u_abs:
+                    candidates.setdefault(u_abs, _candidate(u_abs, alt, cls, _id, "img"))
+
+        elif tag == "link":
+            # link rel icons / preload
+            rel = attrs.get("rel", "").lower()
+            href = attrs.get("href", "")
+            as_attr = attrs.get("as", "").lower()
+            if not href:
+                continue
+            if "icon" in rel or ("preload" in rel and as_attr == "image"):
+                u_abs = abs_url(base_url, href, scheme_host)
+                if u_abs:
+                    candidates.setdefault(u_abs, _candidate(u_abs, rel, "", "", "link"))
+
+        else:
+            # meta items that could point to logo-ish images
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            content = attrs.get("content", "")
+            if not content:
+                continue
+            if key in ("og:image", "twitter:image"):
+                u_abs = abs_url(base_url, content, scheme_host)
+                if u_abs:
+                    candidates.setdefault(u_abs, _candidate(u_abs, key, "", "", "meta"))
+
+    uniq = found["img"]
+    for bucket in (found["link"], found["meta"]):
+        for u, c in bucket.items():
+            uniq.setdefault(u, c)
+
+    return list(uniq.values())
+
+
+def _candidate(url: str, alt: str, cls: str, _id: str, source: str) -> dict:
+    # lowercased copies are made once here so score_candidate doesn't redo them per check
+    return {
+        "url": url,
+        "alt": alt,
+        "class": cls,
+        "id": _id,
+        "source": source,
+        "url_lc": url.lower(),
+        "alt_lc": alt.lower(),
+        "cls_lc": cls.lower(),
+        "id_lc": _id.lower(),
+    }
+
+
+def _attrs(body: str) -> dict[str, str]:
+    # tokenize the attribute part of a tag into a dict; first occurrence wins, like browsers
+    attrs: dict[str, str] = {}
+    for m in _ATTR_RE.finditer(body):
+        name = m.group(1).lower()
+        if name not in attrs:
+            value = m.group(2) or m.group(3) or m.group(4) or ""
+            attrs[name] = htmllib.unescape(value) if "&" in value else value
+    return attrs
 
 
 def score_candidate(c: dict, store: dict) -> int:
-    url = (c.get("url") or "").lower()
-    alt = (c.get("alt") or "").lower()
-    cls = (c.get("class") or "").lower()
-    _id = (c.get("id") or "").lower()
+    url = c["url_lc"]
+    alt = c["alt_lc"]
+    cls = c["cls_lc"]
+    _id = c["id_lc"]
 
     score = 0
     if "cdn.shopify.com" in url:
@@ -192,7 +514,7 @@ def score_candidate(c: dict, store: dict) -> int:
         score -= 1
 
     # deprioritize content images
-    if any(token in url for token in ["banner", "slideshow", "hero", "collection", "product"]):
+    if _CONTENT_IMAGE_RE.search(url):
         score -= 3
 
     # tiny favicons are acceptable fallback but not first choice
@@ -202,85 +524,243 @@ def score_candidate(c: dict, store: dict) -> int:
     return score
 
 
-def download(url: str, out_path: str) -> tuple[str, int]:
-    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-    with urllib.request.urlopen(req, timeout=25) as resp:
-        content_type = (resp.headers.get("Content-Type") or "").split(";")[0].strip().lower()
-        data = resp.read()
-        with open(out_path, "wb") as f:
-            f.write(data)
-        return content_type, len(data)
+def download(url: str) -> tuple[str, bytes]:
+    return _http_get(url, MAX_ASSET_BYTES)
+
+
+# sha256 of asset body -> transparency verdict, for this process
+_TRANSPARENCY_CACHE: dict[bytes, bool] = {}
 
 
-def is_transparent_image(path: str) -> bool:
+def is_transparent_image(data: bytes) -> bool:
     # For raster formats, require at least one transparent pixel.
+    key = hashlib.sha256(data).digest()
+    # shared CDN assets and placeholders repeat across stores; check each body once
+    if key in _TRANSPARENCY_CACHE:
+        return _TRANSPARENCY_CACHE[key]
+
+    digest = key.hex()
+    checker = "pillow" if Image is not None else "identify"
+    row = _cache_exec(
+        "SELECT transparent FROM transparency WHERE sha256 = ? AND checker = ?", (digest, checker)
+    )
+    if row:
+        _TRANSPARENCY_CACHE[key] = bool(row[0])
+        return bool(row[0])
+
+    transparent = _pil_transparent(data) if Image is not None else _identify_transparent(data)
+    if transparent is None:
+        # not cached: an unreadable image or a missing identify shouldn't stick across runs
+        return False
+
+    _cache_exec(
+        "INSERT OR REPLACE INTO transparency VALUES (?, ?, ?, ?)",
+        (digest, checker, int(transparent), time.time()),
+    )
+    _TRANSPARENCY_CACHE[key] = transparent
+    return transparent
+
+
+def _pil_transparent(data: bytes) -> bool | None:
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            # ICO files carry several sizes; check each of them
+            sizes = sorted(im.info.get("sizes") or ()) if im.format == "ICO" else [None]
+            for size in sizes:
+                if size is not None:
+                    # selecting a size only takes effect (mode included) once it is loaded
+                    im.size = size
+                    im.load()
+                for frame in ImageSequence.Iterator(im):
+                    if frame.mode in ("RGBA", "LA", "PA") or "transparency" in frame.info:
+                        if frame.convert("RGBA").getchannel("A").getextrema()[0] < 255:
+                            return True
+            return False
+    except Exception:
+        return None
+
+
+def _identify_transparent(data: bytes) -> bool | None:
+    with tempfile.TemporaryDirectory() as td:
+        path = os.path.join(td, "asset")
+        with open(path, "wb") as f:
+            f.write(data)
+        future: Future = Future()
+        _identify_queue.put((path, future))
+        _start_identify_worker()
+        return future.result()
+
+
+# without Pillow, checks from concurrent trials are handed to a single worker
+# thread that runs one identify process per batch instead of one per image
+_identify_queue: queue.Queue = queue.Queue()
+_identify_lock = threading.Lock()
+_identify_thread: threading.Thread | None = None
+
+
+def _start_identify_worker() -> None:
+    global _identify_thread
+    with _identify_lock:
+        if _identify_thread is None:
+            _identify_thread = threading.Thread(target=_identify_worker, name="identify", daemon=True)
+            _identify_thread.start()
+
+
+def _identify_worker() -> None:
+    while True:
+        # block for one request, then take whatever queued up while the last batch ran
+        batch = [_identify_queue.get()]
+        while True:
+            try:
+                batch.append(_identify_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        verdicts = _identify_batch([path for path, _ in batch])
+        for (_, future), verdict in zip(batch, verdicts):
+            future.set_result(verdict)
+
+
+def _identify_batch(paths: list[str]) -> list[bool | None]:
     # ImageMagick: %[opaque] -> True means fully opaque. We want False.
+    # One line per frame, prefixed with the file name so frames map back to their file;
+    # a file is transparent if any of its frames is.
     try:
-        out = subprocess.check_output(["identify", "-format", "%[opaque]", path], stderr=subprocess.DEVNULL)
-        val = out.decode("utf-8", errors="replace").strip().lower()
-        return val == "false"
+        proc = subprocess.run(
+            ["identify", "-format", "%i %[opaque]\n", *paths],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
     except Exception:
-        return False
+        return [None] * len(paths)
+
+    frames: dict[str, list[str]] = {}
+    for line in proc.stdout.decode("utf-8", errors="replace").splitlines():
+        path, _, opaque = line.rpartition(" ")
+        frames.setdefault(path, []).append(opaque.strip().lower())
+
+    # files identify couldn't read produce no lines (and a non-zero exit for the batch)
+    return [("false" in frames[path]) if path in frames else None for path in paths]
+
+
+def _is_logo_type(url: str, content_type: str) -> bool:
+    # SVG or one of the raster formats we can check for transparency
+    url = url.lower()
+    return (
+        url.endswith(".svg")
+        or content_type == "image/svg+xml"
+        or content_type in RASTER_TYPES
+        or url.endswith(RASTER_EXTS)
+    )
+
+
+def _tiers(scored: list[tuple[int, dict]]) -> list[list[tuple[int, dict]]]:
+    tiers: list[list[tuple[int, dict]]] = [[] for _ in range(len(SCORE_TIERS) + 1)]
+    for score, c in scored:
+        i = next((i for i, floor in enumerate(SCORE_TIERS) if score >= floor), len(SCORE_TIERS))
+        tiers[i].append((score, c))
+    return tiers
+
+
+def _try_candidate(url: str) -> str | None:
+    # content type of url if it is a usable logo, None otherwise
+    url_lc = url.lower()
+
+    # .svg urls are accepted on sight, so a HEAD can't reject them and would only
+    # add a round trip; the capped GET below still enforces the size limit
+    if not url_lc.endswith(".svg"):
+        # reject from headers alone when we can; servers that refuse HEAD just get the GET
+        try:
+            content_type, length = head(url)
+        except Exception:
+            content_type, length = "", None
+        if length is not None and length > MAX_ASSET_BYTES:
+            return None
+        if content_type and not _is_logo_type(url, content_type):
+            return None
+
+    # assets over MAX_ASSET_BYTES raise SizeLimitExceeded mid-transfer
+    try:
+        content_type, data = download(url)
+    except Exception:
+        return None
+
+    # accept SVG as "transparent" (vector), best effort; nothing to decode or write out
+    if url_lc.endswith(".svg") or content_type == "image/svg+xml":
+        return content_type
+
+    # require raster transparency
+    if content_type in RASTER_TYPES or url_lc.endswith(RASTER_EXTS):
+        if is_transparent_image(data):
+            return content_type
+
+    return None
 
 
 def pick_logo_for_store(store: dict) -> tuple[str, dict]:
     html = fetch_html(store["base_url"])
     candidates = parse_candidates(html, store["base_url"])
 
-    scored = sorted(
-        [(score_candidate(c, store), c) for c in candidates],
+    scored = ((score_candidate(c, store), c) for c in candidates)
+    # only the best 80 are ever tried; nlargest keeps sorted()'s order among equal scores
+    scored = heapq.nlargest(
+        80,
+        ((score, c) for score, c in scored if score >= 0 or not _REJECT_RE.search(c["url_lc"])),
         key=lambda x: x[0],
-        reverse=True,
     )
 
     tried = 0
-    for score, c in scored[:80]:
-        url = c["url"]
-        if not url:
-            continue
-
-        tried += 1
-        with tempfile.TemporaryDirectory() as td:
-            filename = os.path.join(td, "asset")
-            try:
-                content_type, size = download(url, filename)
-            except Exception:
-                continue
-
-            # basic sanity: skip huge assets
-            if size > 2_000_000:
-                continue
+    pool = ThreadPoolExecutor(max_workers=CANDIDATE_WORKERS)
+    try:
+        for tier in _tiers(scored):
+            futures = [pool.submit(_try_candidate, c["url"]) for _, c in tier]
+
+            # trials run concurrently but are resolved in score order, so a hit only
+            # wins once every better-ranked candidate has failed
+            for (score, c), future in zip(tier, futures):
+                tried += 1
+                try:
+                    content_type = future.result()
+                except Exception:
+                    # one broken candidate must not fail the whole store
+                    continue
+                if content_type is not None:
+                    meta = {"score": score, "content_type": content_type, "source": c.get("source"), "tried": tried}
+                    return c["url"], meta
+    finally:
+        # don't wait on in-flight trials once we have an answer
+        pool.shutdown(wait=False, cancel_futures=True)
 
-            # accept SVG as "transparent" (vector), best effort.
-            if url.lower().endswith(".svg") or content_type == "image/svg+xml":
-                return url, {"score": score, "content_type": content_type, "source": c.get("source"), "tried": tried}
+    return "", {"score": None, "content_type": None, "source": None, "tried": tried}
 
-            # require raster transparency
-            if content_type in ("image/png", "image/webp", "image/gif", "image/x-icon") or url.lower().endswith(
-                (".png", ".webp", ".gif", ".ico")
-            ):
-                if is_transparent_image(filename):
-                    return url, {"score": score, "content_type": content_type, "source": c.get("source"), "tried": tried}
 
-    return "", {"score": None, "content_type": None, "source": None, "tried": tried}
+def _pick_logo_safe(store: dict) -> tuple[str, dict, Exception | None]:
+    try:
+        logo_url, meta = pick_logo_for_store(store)
+    except Exception as e:
+        return "", {}, e
+    return logo_url, meta, None
 
 
 def main() -> int:
     out = []
     failures = []
 
-    for store in STORES:
-        try:
-            logo_url, meta = pick_logo_for_store(store)
-        except Exception as e:
-            failures.append({"id": store["id"], "error": str(e)})
-            continue
+    with ThreadPoolExecutor(max_workers=STORE_WORKERS) as pool:
+        # map() keeps results in STORES order regardless of completion order
+        results = pool.map(_pick_logo_safe, STORES)
 
-        if not logo_url:
-            failures.append({"id": store["id"], "error": "no transparent logo found"})
-            continue
+        for store, (logo_url, meta, error) in zip(STORES, results):
+            if error is not None:
+                # some exceptions (e.g. a bare TimeoutError()) have no message
+                failures.append({"id": store["id"], "error": str(error) or type(error).__name__})
+                continue
+
+            if not logo_url:
+                failures.append({"id": store["id"], "error": "no transparent logo found"})
+                continue
 
-        out.append({**store, "logo_url": logo_url, "_meta": meta})
+            out.append({**store, "logo_url": logo_url, "_meta": meta})
 
     print(json.dumps({"stores": out, "failures": failures}, indent=2))
     return 0 if not failures else 2